@@ -4,14 +4,17 @@ generating pyomo model for PID example
 import pyomo.environ as pyo
 from pyomo.opt import TerminationCondition, SolverStatus
 from pyomo.contrib.alternative_solutions.aos_utils import get_active_objective
-import pyomo.dae as dae 
 from typing import Tuple, Optional
 from idaes.core.solvers import get_solver
-ipopt = get_solver("ipopt")
+import gurobipy as gp
 
 import os
+import re
+import atexit
+import time
 import numpy as np 
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 np.random.seed(17)
 
@@ -21,9 +24,74 @@ rank = MPI.COMM_WORLD.Get_rank()
 size = MPI.COMM_WORLD.Get_size()
 
 num_scenarios = 5
+scenarios = [f"scen_{i}" for i in range(1,num_scenarios+1)]
+scen_to_idx = {n: int(n.split("_")[1]) for n in scenarios}     # scenario name : row in data.csv
 sp = 0.5
 df = pd.read_csv(os.getcwd() + "/data.csv")
+scen_data = df.to_numpy(dtype=np.float64)                      # row index -> row of values
+col_idx = {header: i for i, header in enumerate(df.columns)}    # column header : column index
+num_disturbances = sum(1 for header in df.columns if header.startswith("disturbance_"))
+disturbance_cols = tuple(f"disturbance_{i}" for i in range(num_disturbances))
+disturbance_idx = [col_idx[header] for header in disturbance_cols]
 plot_dir =  os.getcwd() + "/plots_snoglode_parallel/"
+# ex: "x_s[0.75]" or (as a block of the EF) "scen_1.x_s[0.75]" -> ("x_s", "0.75")
+time_series_var = re.compile(r"(?:^|\.)(x_s|u_s)\[([^\]]+)\]$")
+
+# solvers are set up once per process. the persistent (LB) gurobi instances
+# all build their models on gurobipy's default env -> one license checkout.
+ipopt = get_solver("ipopt")
+
+def _ipopt_linear_solver(linear_solver = "ma57"):
+    '''
+    Returns linear_solver if the ipopt build has it (HSL), otw "mumps".
+    '''
+    probe = pyo.ConcreteModel()
+    probe.x = pyo.Var(initialize=0)
+    probe.obj = pyo.Objective(expr=(probe.x - 1)**2)
+    try:
+        results = get_solver("ipopt").solve(probe,
+                                            options = {"linear_solver": linear_solver},
+                                            load_solutions = False)
+        if results.solver.termination_condition==TerminationCondition.optimal: 
+            return linear_solver
+    except Exception: pass
+    return "mumps"
+
+# separate ipopt for the LB warm start: successive LB solves of a subproblem are on
+# nearby models -> start from the loaded point. (the CG solver keeps the defaults)
+# NOTE: no multiplier suffixes are attached to the models (the gurobi shell interface
+#       used for the UB rejects unknown suffixes) so mu_init is left at its default.
+ipopt_lb = get_solver("ipopt")
+ipopt_lb.options["linear_solver"] = MPI.COMM_WORLD.bcast(_ipopt_linear_solver() if rank==0 else None,
+                                                         root=0)
+ipopt_lb.options["warm_start_init_point"] = "yes"
+ipopt_lb.options["warm_start_bound_push"] = 1e-6
+ipopt_lb.options["warm_start_mult_bound_push"] = 1e-6
+
+# gurobi logs are off unless SNOGLODE_VERBOSE is set (the LB solver's always are)
+# NOTE: tee = False only silences the console; OutputFlag = 0 also turns off any log file.
+gurobi_verbose = bool(os.environ.get("SNOGLODE_VERBOSE"))
+
+nonconvex_gurobi = pyo.SolverFactory("gurobi")
+nonconvex_gurobi.options["NonConvex"] = 2
+if not gurobi_verbose: nonconvex_gurobi.options["OutputFlag"] = 0
+
+# (OutputFlag first: the per-subproblem instances set these params in order)
+nonconvex_gurobi_lb = pyo.SolverFactory("gurobi_persistent")
+nonconvex_gurobi_lb.options["OutputFlag"] = 0
+nonconvex_gurobi_lb.options["NonConvex"] = 2
+nonconvex_gurobi_lb.options["MIPGap"] = 0.2
+nonconvex_gurobi_lb.options["TimeLimit"] = 15
+
+obbt_solver_opts = {
+    "NonConvex": 2,
+    "MIPGap": 1,
+    "TimeLimit": 5
+}
+if not gurobi_verbose: obbt_solver_opts["OutputFlag"] = 0
+
+# release the default env (+ license) when the process exits
+atexit.register(gp.disposeDefaultEnv)
 
 class GurobiLBLowerBounder(sno.AbstractLowerBounder):
     def __init__(self, 
@@ -31,49 +99,184 @@ class GurobiLBLowerBounder(sno.AbstractLowerBounder):
                  time_ub: int = 600) -> None:
         super().__init__(solver = solver,
                          time_ub = time_ub)
-        assert solver.name == "gurobi" or solver.name == "gurobipersistent"
-        self.iter = 0
+        assert solver.name in ("gurobi", "gurobi_persistent", "gurobipersistent")
         self.current_milp_gap = solver.options["MIPGap"]
         if self.current_milp_gap == None:
             print("Gurobi's MIP gap is not specified - will revert to classical LB solves.")
 
+        # global LB at the end of each of the last few BnB iterations (see iter_update)
+        self._history = []
+        
+        # one persistent gurobi instance per subproblem (subproblem name : solver)
+        self._persistent = {}
+
+        # if the last LB solve of a subproblem was infeasible (subproblem name : bool)
+        self._lb_infeasible = {}
+
+        # last gurobi incumbent of each subproblem (subproblem name : {pyo.Var : value})
+        self._incumbent_cache = {}
+
+        # if the last LB solve of a subproblem left a gurobi solution loaded (subproblem name : bool)
+        self._has_warm = {}
+
+        # cumulative LB solve wall time of each subproblem on this rank (subproblem name : seconds)
+        self.solve_times = {}
+
+        # only write readable var / con names to the solvers when debugging
+        self._debug = bool(os.environ.get("SNOGLODE_DEBUG"))
+
+    def _get_persistent_solver(self, 
+                               subproblem_model: pyo.ConcreteModel):
+        """
+        Returns the persistent gurobi solver built for this subproblem, 
+        building it (only once) on the first call.
+        """
+        subproblem_name = subproblem_model.name
+        if subproblem_name not in self._persistent:
+            opt = self.opt.__class__()
+
+            # the successor cut is synced separately (see _sync_persistent_solver)
+            cut_is_active = subproblem_model.successor_lb_cut.active
+            subproblem_model.successor_lb_cut.deactivate()
+            opt.set_instance(subproblem_model,
+                             symbolic_solver_labels = self._debug)
+            if cut_is_active: subproblem_model.successor_lb_cut.activate()
+
+            # params live on the gurobi model, so they can only be set once it exists
+            for key, option in self.opt.options.items():
+                if key != "MIPGap": opt.set_gurobi_param(key, option)
+            if self.current_milp_gap != None:
+                opt.set_gurobi_param("MIPGap", self.current_milp_gap)
+
+            self._persistent[subproblem_name] = opt
+        
+        return self._persistent[subproblem_name]
+
+    def _sync_persistent_solver(self,
+                                opt,
+                                subproblem_model: pyo.ConcreteModel) -> None:
+        """
+        Pushes the modifications made to the pyomo model since the last 
+        solve (bounds / fixed states, successor cut) to the persistent solver.
+        """
+        # branching + bounds tightening only modify var bounds / fixed states
+        for var in subproblem_model.component_data_objects(pyo.Var):
+            opt.update_var(var)
+
+        # the rhs of the successor cut is a mutable param -> re-add it each time
+        cut = subproblem_model.successor_lb_cut
+        if cut in opt._pyomo_con_to_solver_con_map: 
+            opt.remove_constraint(cut)
+        if cut.active and pyo.value(subproblem_model.successor_obj) != float("-inf"):
+            opt.add_constraint(cut)
+
+    def iter_update(self, 
+                    iteration: int, 
+                    lb: float, 
+                    ub: float) -> None:
+        """
+        Tightens the MIP gap (by 0.01, down to 1e-2) once the global LB 
+        has improved by less than 5% over the last 3 BnB iterations.
+        """
+        if self.current_milp_gap == None or self.current_milp_gap <= 1e-2: return
+
+        self._history.append(lb)
+        if len(self._history) <= 3: return
+        self._history = self._history[-4:]
+        
+        prev_lb = self._history[0]
+        if prev_lb == float("-inf"): return
+        rel_improvement = (lb - prev_lb) / max(abs(prev_lb), 1e-8)
+        if rel_improvement >= 0.05: return
+
+        # LB has stagnated -> tighten the gap (rank 0 decides so all ranks agree)
+        new_gap = MPI.COMM_WORLD.bcast(max(self.current_milp_gap - 0.01, 1e-2), root=0)
+        self.current_milp_gap = new_gap
+        for opt in self._persistent.values():
+            opt.set_gurobi_param("MIPGap", new_gap)
+        self._history = []
+
+    def _cache_incumbent(self,
+                         subproblem_model: pyo.ConcreteModel) -> None:
+        """
+        Saves the (loaded) gurobi solution of this subproblem so it
+        can be reused as a MIP start at the next node.
+        """
+        incumbent = pyo.ComponentMap((var, var.value) for var in \
+                                        subproblem_model.component_data_objects(pyo.Var, active=True))
+        self._incumbent_cache[subproblem_model.name] = incumbent
+
+    def _get_cached_incumbent(self,
+                              subproblem_model: pyo.ConcreteModel) -> Optional[pyo.ComponentMap]:
+        """
+        Returns the cached gurobi incumbent of this subproblem if it is still
+        valid within the current node (within all var bounds).
+        Otherwise, returns None.
+        """
+        if subproblem_model.name not in self._incumbent_cache: return None
+        incumbent = self._incumbent_cache[subproblem_model.name]
+
+        for var, value in incumbent.items():
+            if value is None: return None
+            if var.fixed and value != var.value: return None
+            if var.lb is not None and value < var.lb: return None
+            if var.ub is not None and value > var.ub: return None
+        return incumbent
+
     def solve_a_subproblem(self, 
                            subproblem_model: pyo.ConcreteModel,
                            *args, **kwargs) -> Tuple[bool, Optional[float]]:
         
-        # how to tell if we are in a new iteration? wb in parallel?
-        self.iter += 1
-        if self.iter % num_scenarios == 0 \
-            and self.current_milp_gap != 1e-2 \
-                and self.iter > num_scenarios * 18:
-            self.current_milp_gap -= 0.01
-            if self.current_milp_gap < 0: 
-                self.current_milp_gap = 1e-2
-            self.opt.options["MIPGap"] = self.current_milp_gap
-
-        # warm start with the ipopt solution
-        ipopt.solve(subproblem_model,
-                    load_solutions = True)
-        
+        solve_start = time.perf_counter()
+        opt = self._get_persistent_solver(subproblem_model)
+        self._sync_persistent_solver(opt, subproblem_model)
+
+        # the last gurobi solution is a feasible point (not necessarily optimal - the LB
+        # runs with a MIP gap / time limit) - if it is fully populated and still within 
+        # the bounds of this node, it is a good enough warm start without ipopt
+        incumbent = None
+        if self._has_warm.get(subproblem_model.name, False):
+            incumbent = self._get_cached_incumbent(subproblem_model)
+        if incumbent is None:
+            ipopt_lb.solve(subproblem_model,
+                        load_solutions = True)
+
+        # hand gurobi a MIP start (useless if we were just infeasible)
+        # NOTE: gurobi keeps the starts between solves -> clear anything we do not set
+        use_start = not self._lb_infeasible.get(subproblem_model.name, False)
+        for var in subproblem_model.component_data_objects(pyo.Var, active=True):
+            value = None
+            if use_start: value = var.value if incumbent is None else incumbent[var]
+            opt.set_var_attr(var, "Start", gp.GRB.UNDEFINED if value is None else value)
+
         # solve explicitly to global optimality with gurobi
-        results = self.opt.solve(subproblem_model,
-                                 load_solutions = False, 
-                                 symbolic_solver_labels = True,
-                                 tee = False)
+        results = opt.solve(save_results = False,
+                            load_solutions = False,
+                            tee = False)
+        gurobi_solved = True
         
         # if we reached the maximum time limit, use the ipopt solution
         if results.solver.termination_condition==TerminationCondition.maxTimeLimit:
-            results = ipopt.solve(subproblem_model,
-                                  load_solutions = False, 
-                                  symbolic_solver_labels = True,
-                                  tee = False)
+            results = ipopt_lb.solve(subproblem_model,
+                                     load_solutions = False, 
+                                     symbolic_solver_labels = self._debug,
+                                     tee = False)
+            gurobi_solved = False
+        
+        self.solve_times[subproblem_model.name] = self.solve_times.get(subproblem_model.name, 0) \
+                                                    + time.perf_counter() - solve_start
             
         # if the solution is optimal, return objective value
         if results.solver.termination_condition==TerminationCondition.optimal and \
             results.solver.status==SolverStatus.ok:
 
             # load in solutions, return [feasibility = True, obj]
-            subproblem_model.solutions.load_from(results)
+            self._lb_infeasible[subproblem_model.name] = False
+            if gurobi_solved: 
+                opt.load_vars()
+                self._cache_incumbent(subproblem_model)
+                self._has_warm[subproblem_model.name] = True
+            else: subproblem_model.solutions.load_from(results)
             # gap = (results.problem.upper_bound - results.problem.lower_bound) / results.problem.upper_bound
 
             # if we do not have a sufficiently small gap, return LB
@@ -87,42 +290,54 @@ class GurobiLBLowerBounder(sno.AbstractLowerBounder):
                 return True, pyo.value(get_active_objective(subproblem_model))
 
         # if the solution is not feasible, return None
-        elif results.solver.termination_condition == TerminationCondition.infeasible:
+        # (the objective is a sum of squares, so infeasibleOrUnbounded can only be infeasible)
+        elif results.solver.termination_condition in (TerminationCondition.infeasible,
+                                                      TerminationCondition.infeasibleOrUnbounded):
+            self._lb_infeasible[subproblem_model.name] = True
+            self._has_warm[subproblem_model.name] = False
             return False, None
         else: raise RuntimeError(f"unexpected termination_condition for lower bounding problem: {results.solver.termination_condition}")
     
 
-def build_pid_model(scenario_name):
+def balance_scenarios(solve_times, num_ranks):
     '''
-    Build instance of pyomo PID model 
+    Longest processing time (LPT) assignment of scenarios to ranks:
+    the most expensive scenario goes to the currently least loaded rank.
 
     Parameters
     -----------
-    setpoint_change: float
-        Value for the new setpoint 
-    model_uncertainty: list
-        List containing the values for the model uncertainty in the form: [tau_xs, tau_us, tau_ds]
-    disturbance: float
-        Value for the disturbance 
+    solve_times: dict
+        scenario name : measured solve time (seconds)
+    num_ranks: int
+        number of parallel processes
 
     Returns
     -----------
-    m: Concrete Pyomo model 
-        Instance of pyomo model with uncertain parameters  
+    assignment: list
+        list (one per rank) of lists of scenario names
     '''
-    # unpack scenario name
-    _, scen_num = scenario_name.split("_")
+    assignment = [[] for _ in range(num_ranks)]
+    loads = [0.0 for _ in range(num_ranks)]
+    for scen in sorted(solve_times, key=solve_times.get, reverse=True):
+        least_loaded = loads.index(min(loads))
+        assignment[least_loaded].append(scen)
+        loads[least_loaded] += solve_times[scen]
+    return assignment
 
-    # retrieve random realizations
-    row_data = df.iloc[int(scen_num)]
-    tau_xs = float(row_data["tau_xs"])
-    tau_us = float(row_data["tau_us"])
-    tau_ds = float(row_data["tau_ds"])
-    num_disturbances = sum(1 for header in df.columns.tolist() if "disturbance" in header)
-    disturbance = [float(row_data[f"disturbance_{i}"]) for i in range(num_disturbances)]
-    # setpoint_change = float(row_data["setpoint_change"])
-    setpoint_change = sp
 
+_pid_template = None
+
+def _build_template():
+    '''
+    Build the discretized pyomo PID model, without any scenario data.
+    The uncertain parameters (tau_xs, tau_us, tau_ds, d_s) are mutable 
+    and are set per scenario in build_pid_model.
+
+    Returns
+    -----------
+    m: Concrete Pyomo model 
+        Discretized PID model with mutable uncertain parameters
+    '''
     '''''''''''''''
     # create model #
     '''''''''''''''
@@ -131,19 +346,20 @@ def build_pid_model(scenario_name):
     '''''''''''''''
     #### Sets ####
     '''''''''''''''
-    # define time set 
+    # define time set (already discretized - nfe uniform finite elements over [0, T])
     T = 15
+    nfe = 20
     m.time = pyo.RangeSet(0,T)
-    m.t = dae.ContinuousSet(bounds=(0,T))
+    m.t = pyo.Set(initialize=[T*i/nfe for i in range(nfe+1)], ordered=True)
 
     '''''''''''''''
     # Parameters #
     '''''''''''''''
     # define model parameters 
-    m.x_setpoint = pyo.Param(initialize=setpoint_change)        # set-point 
-    m.tau_xs = pyo.Param(initialize=tau_xs)                     # model structural uncertainty 
-    m.tau_us = pyo.Param(initialize=tau_us)                     # model structural uncertainty
-    m.tau_ds = pyo.Param(initialize=tau_ds)                     # model structural uncertainty 
+    m.x_setpoint = pyo.Param(initialize=sp)                     # set-point 
+    m.tau_xs = pyo.Param(initialize=0, mutable=True)            # model structural uncertainty 
+    m.tau_us = pyo.Param(initialize=0, mutable=True)            # model structural uncertainty
+    m.tau_ds = pyo.Param(initialize=0, mutable=True)            # model structural uncertainty 
     m.d_s = pyo.Param(m.t, initialize=0, mutable=True)          # disturbances 
 
     '''''''''''''''
@@ -157,9 +373,9 @@ def build_pid_model(scenario_name):
     m.e_s = pyo.Var(m.t, domain=pyo.Reals)                      # change in x from set point 
     m.u_s = pyo.Var(m.t, domain=pyo.Reals, bounds=[-5.0, 5.0])  
 
-    # define dervative variable for x_s
-    m.dxdt = dae.DerivativeVar(m.x_s, wrt=m.t)      # derivative of state-time trajectory variable
-    m.dedt = dae.DerivativeVar(m.e_s, wrt=m.t)      # derivative of 
+    # derivatives are backward differences, written directly into the constraints
+    def backward_difference(v, t):
+        return (v[t] - v[m.t.prev(t)]) / (t - m.t.prev(t))
 
     '''''''''''''''
     # Constraints #
@@ -169,7 +385,7 @@ def build_pid_model(scenario_name):
     @m.Constraint(m.t)
     def dxdt_con(m, t):
         if t == m.t.first(): return pyo.Constraint.Skip
-        else: return m.dxdt[t] == -m.tau_xs*m.x_s[t] + m.tau_us*m.u_s[t] + m.tau_ds*m.d_s[t]
+        else: return backward_difference(m.x_s, t) == -m.tau_xs*m.x_s[t] + m.tau_us*m.u_s[t] + m.tau_ds*m.d_s[t]
         
     m.x_init_cond = pyo.Constraint(expr=m.x_s[m.t.first()] == 0)
 
@@ -189,28 +405,65 @@ def build_pid_model(scenario_name):
 
     @m.Constraint(m.t)
     def u_con(m, t):
-        return m.u_s[t] == m.K_p*m.e_s[t] + m.K_i * m.I[t] + m.K_d * m.dedt[t]
+        # the (backward) derivative of e is not defined at the first time point
+        if t == m.t.first(): return pyo.Constraint.Skip
+        else: return m.u_s[t] == m.K_p*m.e_s[t] + m.K_i * m.I[t] + m.K_d * backward_difference(m.e_s, t)
 
-        
     '''''''''''''''
     ## Objective ##
     '''''''''''''''
-    def e_sq_integral_rule(m, t):
-        return 10*m.e_s[t]**2 + 0.01*m.u_s[t]**2
-    m.e_sq_integral = dae.Integral(m.t, wrt=m.t, rule=e_sq_integral_rule)
-    m.obj = pyo.Objective(sense=pyo.minimize, expr=m.e_sq_integral)
+    # integral of the squared error (trapezoidal rule over the discretized time points)
+    time_pts = list(m.t)
+    weights = [(time_pts[1] - time_pts[0]) / 2] \
+                + [(time_pts[i+1] - time_pts[i-1]) / 2 for i in range(1, len(time_pts) - 1)] \
+                    + [(time_pts[-1] - time_pts[-2]) / 2]
+    m.obj = pyo.Objective(sense=pyo.minimize, 
+                          expr=sum(w * (10*m.e_s[t]**2 + 0.01*m.u_s[t]**2) for w, t in zip(weights, time_pts)))
 
-    '''''''''''''''
-    # Discretize #
-    '''''''''''''''
-    discretizer = pyo.TransformationFactory('dae.finite_difference')
-    discretizer.apply_to(m, nfe=20, wrt=m.t, scheme='BACKWARD')
- 
-    # setting disturbance parameters over discretized time
-    index = 0
-    for t in m.t:  
-        m.d_s[t] = disturbance[index]
-        index += 1
+    return m
+
+
+def build_pid_model(scenario_name):
+    '''
+    Build instance of pyomo PID model (a clone of the cached template
+    with this scenarios uncertain parameters)
+
+    Parameters
+    -----------
+    scenario_name: str
+        Name of the scenario, in the form "scen_<row in data.csv>"
+
+    Returns
+    -----------
+    m: Concrete Pyomo model 
+        Instance of pyomo model with uncertain parameters  
+    first_stage: dict
+        first stage variables (name : pyo.Var)
+    probability: float
+        probability of this scenario
+    '''
+    global _pid_template
+
+    # retrieve random realizations
+    row_data = scen_data[scen_to_idx[scenario_name]]
+    tau_xs = float(row_data[col_idx["tau_xs"]])
+    tau_us = float(row_data[col_idx["tau_us"]])
+    tau_ds = float(row_data[col_idx["tau_ds"]])
+    disturbance = row_data[disturbance_idx]
+    # setpoint_change = float(row_data[col_idx["setpoint_change"]])
+
+    # the model structure is the same for all scenarios -> only build it once
+    if _pid_template is None: _pid_template = _build_template()
+    m = _pid_template.clone()
+    m.tau_xs.set_value(tau_xs)
+    m.tau_us.set_value(tau_us)
+    m.tau_ds.set_value(tau_ds)
+
+    # setting disturbance parameters over discretized time (zero if not given)
+    time_pts = list(m.t)
+    if len(disturbance) < len(time_pts):
+        disturbance = np.pad(disturbance, (0, len(time_pts) - len(disturbance)))
+    m.d_s.store_values(dict(zip(time_pts, disturbance)))
 
     first_stage = {
         "K_p": m.K_p,
@@ -225,26 +478,13 @@ def build_pid_model(scenario_name):
 
 
 if __name__ == '__main__':
-    nonconvex_gurobi = pyo.SolverFactory("gurobi")
-    nonconvex_gurobi.options["NonConvex"] = 2
-    
-    nonconvex_gurobi_lb = pyo.SolverFactory("gurobi")
-    nonconvex_gurobi_lb.options["NonConvex"] = 2
-    nonconvex_gurobi_lb.options["MIPGap"] = 0.2
-    nonconvex_gurobi_lb.options["TimeLimit"] = 15
-    scenarios = [f"scen_{i}" for i in range(1,num_scenarios+1)]
-
-    obbt_solver_opts = {
-        "NonConvex": 2,
-        "MIPGap": 1,
-        "TimeLimit": 5
-    }
-
     params = sno.SolverParameters(subproblem_names = scenarios,
                                   subproblem_creator = build_pid_model,
                                   lb_solver = nonconvex_gurobi_lb,
                                   cg_solver = ipopt,
                                   ub_solver = nonconvex_gurobi)
+    # round-robin the scenarios over the ranks
+    params.set_rank_subproblem_names(scenarios[rank::size])
     params.set_bounders(candidate_solution_finder = sno.SolveExtensiveForm,
                         lower_bounder = GurobiLBLowerBounder)
     params.set_bounds_tightening(fbbt=True, 
@@ -268,60 +508,72 @@ if __name__ == '__main__':
                  rel_tolerance = 1e-3,
                  time_limit = 600*6)
 
+    # collect LB solve times of all scenarios (lists are concatenated by MPI.SUM)
+    lb_solve_times = MPI.COMM_WORLD.allreduce(list(solver.lower_bounder.solve_times.items()),
+                                              op=MPI.SUM)
+
     if (rank==0):
+        print("\n====================================================================")
+        print("LB SOLVE TIMES")
+        lb_solve_times = dict(lb_solve_times)
+        for n in scenarios:
+            print(f"  subproblem = {n}, time = {lb_solve_times.get(n, 0):.2f} s")
+        if size > 1:
+            print("  balanced rank assignment (for set_rank_subproblem_names):")
+            for r, rank_scenarios in enumerate(balance_scenarios(lb_solve_times, size)):
+                print(f"    rank {r}: {rank_scenarios}")
+
         print("\n====================================================================")
         print("SOLUTION")
+        plot_dpi = 300 if os.environ.get("HIGHDPI") == "1" else 150
+        os.makedirs(plot_dir, exist_ok=True)
+        plot_saver = ThreadPoolExecutor(max_workers=2)
+        saved_plots = []
         for n in solver.subproblems.names:
             print(f"subproblem = {n}")
             x, u = {}, {}
-            for vn in solver.solution.subproblem_solutions[n]:
+            for vn, var_val in solver.solution.subproblem_solutions[n].items():
 
                 # display first stage only (for sanity check)
-                if vn=="K_p" or vn=="K_i" or vn=="K_d":
-                    var_val = solver.solution.subproblem_solutions[n][vn]
+                # NOTE: names may carry a block prefix (ex: "scen_1.K_p")
+                if vn.rsplit(".", 1)[-1] in ("K_p", "K_i", "K_d"):
                     print(f"  var name = {vn}, value = {var_val}")
 
                 # collect plot data on x_s, u_s
-                if "x_s" in vn:
-                    _, half_stripped_time = vn.split("[")
-                    stripped_time = half_stripped_time.split("]")[0]
-                    time = float(stripped_time)
-                    var_val = solver.solution.subproblem_solutions[n][vn]
-                    x[time] = var_val
-                
-                if "u_s" in vn:
-                    _, half_stripped_time = vn.split("[")
-                    stripped_time = half_stripped_time.split("]")[0]
-                    time = float(stripped_time)
-                    var_val = solver.solution.subproblem_solutions[n][vn]
-                    u[time] = var_val
-
-            # plot
-            scen_num = n.split("_")[1]
-            plt.suptitle(f"Scenario {scen_num}")
-            plt.subplot(1, 2, 1)
-            plt.plot(x.keys(), x.values())
-            row_data = df.iloc[int(scen_num)]
-            # setpoint_change = row_data["setpoint_change"]
+                match = time_series_var.search(vn)
+                if match:
+                    (x if match.group(1)=="x_s" else u)[float(match.group(2))] = var_val
+
+            # plot (sorted by time, so the lines do not depend on dict order)
+            # each scenario gets its own figure, so it can be saved in the background
+            scen_num = scen_to_idx[n]
+            fig = Figure()
+            ax_x, ax_u = fig.subplots(1, 2)
+            fig.suptitle(f"Scenario {scen_num}")
+            ax_x.plot(*zip(*sorted(x.items())))
+            row_data = scen_data[scen_num]
+            # setpoint_change = row_data[col_idx["setpoint_change"]]
             setpoint_change = sp
-            plt.axhline(y = setpoint_change, 
-                        color='r', 
-                        linestyle='dotted', 
-                        linewidth=2, 
-                        label="set point")
-            plt.xlabel('Time')
-            plt.ylabel('x')
-            plt.legend()
-
-            plt.subplot(1, 2, 2)
-            plt.plot(u.keys(), u.values())
-            plt.xlabel('Time')
-            plt.ylabel('u')
-
-            plt.tight_layout()
-            plt.savefig(plot_dir + f'scen_{scen_num}.png',
-                        dpi=300)
-            plt.clf()
+            ax_x.axhline(y = setpoint_change, 
+                         color='r', 
+                         linestyle='dotted', 
+                         linewidth=2, 
+                         label="set point")
+            ax_x.set_xlabel('Time')
+            ax_x.set_ylabel('x')
+            ax_x.legend()
+
+            ax_u.plot(*zip(*sorted(u.items())))
+            ax_u.set_xlabel('Time')
+            ax_u.set_ylabel('u')
+
+            fig.tight_layout()
+            saved_plots.append(plot_saver.submit(fig.savefig, 
+                                                 plot_dir + f'scen_{scen_num}.png',
+                                                 dpi=plot_dpi))
 
             print()
+        # re-raise any error from the background saves
+        for saved_plot in saved_plots: saved_plot.result()
+        plot_saver.shutdown(wait=True)
         print("====================================================================")
\ No newline at end of file
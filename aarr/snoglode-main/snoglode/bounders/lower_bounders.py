@@ -221,6 +221,29 @@ class AbstractLowerBounder(BoundingProblemBase):
         subproblem_model.successor_lb_cut.deactivate()
 
 
+    def iter_update(self,
+                    iteration: int,
+                    lb: float,
+                    ub: float) -> None:
+        """
+        Called by the solver at the end of every BnB iteration
+        with the current global bounds (identical on all ranks).
+
+        Does nothing by default; a child class can override this
+        to adapt its solve settings to the progress of the bounds.
+
+        Parameters
+        -----------
+        iteration : int
+            current iteration of the spatial BnB algorithm.
+        lb : float
+            current global lower bound.
+        ub : float
+            current global upper bound.
+        """
+        pass
+
+
     def solve_a_subproblem(self, 
                            subproblem_name: str, 
                            subproblem_model: pyo.ConcreteModel, 
@@ -272,6 +272,11 @@ class Solver():
         self.iteration += 1
         self.runtime = time.perf_counter() - self.start_time
 
+        # let the lower bounder react to the bound progress
+        self.lower_bounder.iter_update(iteration = self.iteration,
+                                       lb = self.tree.metrics.lb,
+                                       ub = self.tree.metrics.ub)
+
         # print metrics to terminal
         if (rank==0): self.display_status(bnb_result)
 
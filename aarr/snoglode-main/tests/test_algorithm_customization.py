@@ -75,5 +75,50 @@ def test_customizable_node_feasibility_checker():
 
     assert solver.tree.metrics.lb == pytest.approx(383.213)
 
+@pytest.mark.mpi_skip()
+def test_lower_bounder_iter_update():
+    """
+    check that the lower bounder is handed the global bounds
+    at the end of every iteration.
+    """
+    nb_facilities = 4
+    max_facilities = 1
+    total_communities = 10
+    nb_subproblems = 2
+
+    subproblem_names = [f"facilities_{nb_facilities}_max_{max_facilities}_communities_{total_communities}_subproblems_{nb_subproblems}_subproblem_{subproblem}" \
+                            for subproblem in np.arange(nb_subproblems)]
+
+    class RecordingLowerBounder(sno.DropNonants):
+        def __init__(self, solver, time_ub: int = 600) -> None:
+            super().__init__(solver = solver,
+                             time_ub = time_ub)
+            self.history = []
+
+        def iter_update(self, iteration, lb, ub) -> None:
+            self.history.append((iteration, lb, ub))
+
+    # set up solver
+    params = sno.SolverParameters(subproblem_names=subproblem_names,
+                                  subproblem_creator=pmedian_subproblem_creator,
+                                  lb_solver = lb_solver,
+                                  cg_solver = cg_solver)
+    params.set_bounds_tightening(fbbt = False,
+                                 obbt = False)
+    params.deactivate_global_guarantee()
+    params.set_bounders(candidate_solution_finder = MockCandidateGenerator,
+                        lower_bounder = RecordingLowerBounder)
+    params.set_queue_strategy(sno.QueueStrategy.lifo)
+
+    solver = sno.Solver(params)
+    solver.solve(max_iter=10,
+                 collect_plot_info=False)
+
+    history = solver.lower_bounder.history
+    assert [iteration for iteration, _, _ in history] == list(range(1, solver.iteration + 1))
+    assert history[-1][1] == solver.tree.metrics.lb
+    assert history[-1][2] == solver.tree.metrics.ub
+
 if __name__=="__main__":
-    test_customizable_node_feasibility_checker()
\ No newline at end of file
+    test_customizable_node_feasibility_checker()
+    test_lower_bounder_iter_update()
\ No newline at end of file